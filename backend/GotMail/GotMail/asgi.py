@@ -17,10 +17,13 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "GotMail.settings")
 
 # Initialize Django ASGI application early to ensure the AppRegistry
 # is populated before importing code that may import ORM models.
+django_asgi_app = get_asgi_application()
+
+from gotmail_service.middleware import SessionTokenMiddleware  # noqa: E402
 
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),  # Use the existing django_asgi_app
+        "http": SessionTokenMiddleware(django_asgi_app),
         "websocket": AuthMiddlewareStack(  # Wrap with AuthMiddlewareStack
             URLRouter(
                 gotmail_service.routing.websocket_urlpatterns  # Include the email_app websocket routing
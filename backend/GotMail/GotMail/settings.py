@@ -74,6 +74,13 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6380/1",
+    }
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -87,6 +94,11 @@ DATABASES = {
         "PASSWORD": DB_PASSWORD,
         "HOST": "localhost",
         "PORT": "5432",
+        # Served over ASGI, where every request runs in a fresh thread and a
+        # persistent connection is never reused; pool with pgbouncer instead
+        "CONN_MAX_AGE": 0,
+        # Required when running behind pgbouncer in transaction pooling mode
+        "DISABLE_SERVER_SIDE_CURSORS": True,
     }
 }
 
@@ -146,6 +158,10 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_RENDERER_CLASSES": (
+        "gotmail_service.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 
@@ -39,6 +39,7 @@ from gotmail_service.views import (
     RegisterView,
     RequestVerificationView,
     SendEmailView,
+    SettingsBundleView,
     UserProfileView,
     ValidateTokenView,
     Verify2FAView,
@@ -67,6 +68,7 @@ urlpatterns = [
     path("user/auto_rep/", AutoReplySettingsView.as_view(), name="api_send_mail"),
     path("user/darkmode/", DarkModeToggleView.as_view(), name="api_darkmode_toggle"),
     path("user/email_pref/", FontSettingsView.as_view(), name="api_email_pref"),
+    path("user/settings/", SettingsBundleView.as_view(), name="api_settings_bundle"),
     path("user/labels/", LabelManagementView.as_view(), name="api_email_labels"),
     path("user/email_labels/", LabelEmailView.as_view(), name="api_user_email_labels"),
     path("email/send/", SendEmailView.as_view(), name="api_send_mail"),
@@ -1,10 +1,13 @@
 import json
+import logging
 
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 
 class EmailConsumer(AsyncWebsocketConsumer):
     active_connections = {}  # type: ignore  # {user_id: [channel_name1, channel_name2, ...]}
@@ -26,7 +29,9 @@ class EmailConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             self.active_connections[self.user.id].append(self.channel_name)
 
-            print(f"Connected WebSocket: {self.channel_name} for {self.group_name}")
+            logger.debug(
+                "Connected WebSocket: %s for %s", self.channel_name, self.group_name
+            )
             await self.accept()
         else:
             await self.close()
@@ -34,8 +39,10 @@ class EmailConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
             try:
-                print(
-                    f"Disconnecting WebSocket: {self.channel_name} for {self.group_name}"
+                logger.debug(
+                    "Disconnecting WebSocket: %s for %s",
+                    self.channel_name,
+                    self.group_name,
                 )
 
                 # Remove this connection from the group and active connections
@@ -48,13 +55,11 @@ class EmailConsumer(AsyncWebsocketConsumer):
                 if not self.active_connections[self.user.id]:
                     del self.active_connections[self.user.id]
             except Exception as e:
-                print(e)
+                logger.warning("WebSocket disconnect cleanup failed: %s", e)
 
     async def email_notification(self, event):
-        print(self.user)
-        print(self.group_name)
         # Send email notification to the client
-        print(f"Sending email notification to client: {event}")
+        logger.debug("Sending email notification to %s", self.group_name)
         await self.send(
             text_data=json.dumps(
                 {
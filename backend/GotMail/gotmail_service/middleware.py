@@ -0,0 +1,22 @@
+class SessionTokenMiddleware:
+    """
+    ASGI middleware that notes whether a request carries a session token.
+
+    scope["_has_auth"] records whether a non-empty Authorization header was
+    sent, so SessionTokenAuthentication can turn anonymous requests away
+    without reading the headers again. The token itself is resolved inside
+    Django, where the request's database connection is managed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope["_has_auth"] = False
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scope["_has_auth"] = bool(value)
+                    break
+
+        return await self.app(scope, receive, send)
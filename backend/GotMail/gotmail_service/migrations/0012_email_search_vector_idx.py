@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-14 14:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+from gotmail_service.utils import email_search_text
+
+
+def fill_search_text(apps, schema_editor):
+    Email = apps.get_model("gotmail_service", "Email")
+    batch = []
+    for email in Email.objects.only("id", "body").iterator(chunk_size=500):
+        email.search_text = email_search_text(email.body)
+        batch.append(email)
+        if len(batch) == 500:
+            Email.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    Email.objects.bulk_update(batch, ["search_text"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gotmail_service", "0011_alter_user_session_token"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="email",
+            name="search_text",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="email",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "subject", "search_text", config="english"
+                ),
+                name="email_search_vector_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_missing_user_settings(apps, schema_editor):
+    User = apps.get_model("gotmail_service", "User")
+    UserSettings = apps.get_model("gotmail_service", "UserSettings")
+    UserSettings.objects.bulk_create(
+        [
+            UserSettings(user=user)
+            for user in User.objects.filter(settings__isnull=True)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gotmail_service", "0012_email_search_vector_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_missing_user_settings, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-14 14:50
+
+from django.db import migrations, models
+
+
+def clear_inverted_auto_reply_end_dates(apps, schema_editor):
+    UserSettings = apps.get_model("gotmail_service", "UserSettings")
+    UserSettings.objects.filter(
+        auto_reply_end_date__lt=models.F("auto_reply_start_date")
+    ).update(auto_reply_end_date=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gotmail_service", "0013_backfill_usersettings"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            clear_inverted_auto_reply_end_dates, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="usersettings",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("auto_reply_end_date__gte", models.F("auto_reply_start_date")),
+                    ("auto_reply_start_date__isnull", True),
+                    ("auto_reply_end_date__isnull", True),
+                    _connector="OR",
+                ),
+                name="ar_date_order",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-14 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gotmail_service", "0014_usersettings_ar_date_order"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="email",
+            index=models.Index(
+                fields=["-sent_at", "-id"], name="email_sent_at_id_idx"
+            ),
+        ),
+    ]
@@ -1,14 +1,35 @@
+import logging
+import secrets
 import uuid
 
 from django.contrib.auth.models import (
     AbstractUser,
     BaseUserManager,
 )
-from django.core.validators import RegexValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
 from django.utils import timezone
 from pydantic import ValidationError
 
+from .utils import email_search_text, invalidate_session_user
+from .validators import phone_regex
+
+logger = logging.getLogger(__name__)
+
+# User columns loaded for an authenticated session: the token pair plus what
+# UserSerializer renders. Everything else is fetched lazily if ever touched.
+SESSION_USER_FIELDS = (
+    "id",
+    "session_token",
+    "session_expiry",
+    "phone_number",
+    "first_name",
+    "last_name",
+    "email",
+    "is_phone_verified",
+)
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, phone_number, password=None, **extra_fields):
@@ -25,11 +46,16 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(phone_number, password, **extra_fields)
 
-
-phone_regex = RegexValidator(
-    regex=r"^\+?1?\d{9,15}$",
-    message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.",
-)
+    def for_session_token(self, session_token):
+        """
+        Users holding a live session token, with profile and settings joined in.
+        Only SESSION_USER_FIELDS are read from the user row.
+        """
+        return (
+            self.select_related("profile", "settings")
+            .only(*SESSION_USER_FIELDS, "profile", "settings")
+            .filter(session_token=session_token, session_expiry__gt=timezone.now())
+        )
 
 
 class User(AbstractUser):
@@ -40,7 +66,9 @@ class User(AbstractUser):
     is_phone_verified = models.BooleanField(default=False)
 
     # Session token for persistent login
-    session_token = models.CharField(max_length=255, blank=True, null=True)
+    session_token = models.CharField(
+        max_length=255, blank=True, null=True, db_index=True
+    )
     session_expiry = models.DateTimeField(blank=True, null=True)
 
     username = models.CharField(
@@ -74,12 +102,12 @@ class User(AbstractUser):
     def generate_password_reset_token(self):
         self.password_reset_token = str(uuid.uuid4())
         self.password_reset_expires = timezone.now() + timezone.timedelta(hours=1)
-        self.save()
+        self.save(update_fields=["password_reset_token", "password_reset_expires"])
 
     def generate_verification_code(self):
-        self.verification_code = str(uuid.uuid4())[:6]
+        self.verification_code = str(secrets.randbelow(900000) + 100000)
         self.verification_code_expires = timezone.now() + timezone.timedelta(minutes=10)
-        self.save()
+        self.save(update_fields=["verification_code", "verification_code_expires"])
 
     def __str__(self):
         return self.phone_number
@@ -91,10 +119,11 @@ class User(AbstractUser):
         Returns:
             str: A unique UUID-based session token
         """
-        print("Generating session token")
+        logger.debug("Generating session token for user %s", self.pk)
+        invalidate_session_user(self.session_token)
         self.session_token = str(uuid.uuid4())
         self.session_expiry = timezone.now() + timezone.timedelta(days=30)
-        self.save()
+        self.save(update_fields=["session_token", "session_expiry"])
 
 
 class UserProfile(models.Model):
@@ -107,6 +136,10 @@ class UserProfile(models.Model):
     two_factor_enabled = models.BooleanField(default=False)
 
 
+# Shared by the GIN index and search queries so Postgres can match them up
+EMAIL_SEARCH_VECTOR = SearchVector("subject", "search_text", config="english")
+
+
 class Email(models.Model):
     message_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     sender = models.ForeignKey(
@@ -131,10 +164,20 @@ class Email(models.Model):
         "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="replies"
     )
     headers = models.JSONField(blank=True, null=True)  # Stores metadata like message-id
+    # Plain text of the body, kept in sync by save() for the search index
+    search_text = models.TextField(blank=True, default="", editable=False)
 
     def __str__(self):
         return f"Email from {self.sender} to {self.recipients.all()} - {self.subject}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "body" in update_fields:
+            self.search_text = email_search_text(self.body)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "search_text"}
+        super().save(*args, **kwargs)
+
     def can_view(self, user):
         return (
             self.sender == user
@@ -143,6 +186,12 @@ class Email(models.Model):
             or user in self.bcc.all()
         )
 
+    class Meta:
+        indexes = [
+            GinIndex(EMAIL_SEARCH_VECTOR, name="email_search_vector_idx"),
+            models.Index(fields=["-sent_at", "-id"], name="email_sent_at_id_idx"),
+        ]
+
 
 class Attachment(models.Model):
     def validate_file_size(value):
@@ -198,6 +247,18 @@ class UserSettings(models.Model):
     auto_reply_start_date = models.DateTimeField(blank=True, null=True)
     auto_reply_end_date = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(
+                    auto_reply_end_date__gte=models.F("auto_reply_start_date")
+                )
+                | models.Q(auto_reply_start_date__isnull=True)
+                | models.Q(auto_reply_end_date__isnull=True),
+                name="ar_date_order",
+            )
+        ]
+
     def __str__(self):
         return f"Settings for {self.user.phone_number}"
 
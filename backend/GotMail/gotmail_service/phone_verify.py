@@ -1,3 +1,5 @@
+import logging
+
 from twilio.rest import Client
 from GotMail.super_secrets import (
     TWILIO_ACCOUNT_SID,
@@ -5,9 +7,11 @@ from GotMail.super_secrets import (
     TWILIO_VERIFY_SERVICE_SID,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def send_verification_code(phone_number):
-    print(f"received {phone_number}")
+    logger.debug("Sending verification code by SMS")
     client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
     verification = client.verify.v2.services(
         TWILIO_VERIFY_SERVICE_SID
@@ -20,7 +24,7 @@ def verify_code(user, code):
     check = client.verify.v2.services(
         TWILIO_VERIFY_SERVICE_SID
     ).verification_checks.create(to=user.phone_number, code=code)
-    print(f"User give: {code}")
+    logger.debug("Verification check for user %s: %s", user.pk, check.status)
     if check.status == "approved":
         user.is_phone_verified = True
         user.save()
@@ -1,4 +1,5 @@
 import json
+import logging
 
 import magic
 from asgiref.sync import async_to_sync
@@ -19,6 +20,11 @@ from .models import (
     UserProfile,
     UserSettings,
 )
+from .validators import phone_regex
+
+logger = logging.getLogger(__name__)
+
+AUTO_REPLY_DATE_ORDER_ERROR = _("Auto-reply end date cannot be before its start date.")
 
 
 class BaseUserValidationMixin:
@@ -33,15 +39,6 @@ class BaseUserValidationMixin:
         if User.objects.filter(email=email).exists():
             raise serializers.ValidationError({"email": "Email is already registered."})
 
-    def validate_unique_phone(self, phone_number):
-        """
-        Validate that the phone number is unique across the system.
-        """
-        if User.objects.filter(phone_number=phone_number).exists():
-            raise serializers.ValidationError(
-                {"phone_number": "Phone number is already registered."}
-            )
-
 
 class UserSerializer(serializers.ModelSerializer):
     profile_picture = serializers.SerializerMethodField()
@@ -133,6 +130,10 @@ class UserRegisterSerializer(BaseUserValidationMixin, serializers.ModelSerialize
             "password2",
             "verification_code",
         )
+        extra_kwargs = {
+            # Uniqueness is left to the database unique index, see RegisterView
+            "phone_number": {"validators": [phone_regex]},
+        }
 
     def validate(self, attrs):
         """
@@ -161,8 +162,6 @@ class UserRegisterSerializer(BaseUserValidationMixin, serializers.ModelSerialize
                 {"password": "Password fields didn't match."}
             )
 
-        # Use mixin methods for unique validation
-        self.validate_unique_phone(attrs.get("phone_number"))
         self.validate_unique_email(attrs.get("email"))
 
         return attrs
@@ -244,6 +243,21 @@ class AutoReplySettingsSerializer(serializers.ModelSerializer):
                 }
             )
 
+        # Mirrors the ar_date_order check constraint, merging in stored dates
+        # for partial updates
+        start = data.get(
+            "auto_reply_start_date",
+            getattr(self.instance, "auto_reply_start_date", None),
+        )
+        end = data.get(
+            "auto_reply_end_date",
+            getattr(self.instance, "auto_reply_end_date", None),
+        )
+        if start and end and end < start:
+            raise serializers.ValidationError(
+                {"auto_reply_end_date": AUTO_REPLY_DATE_ORDER_ERROR}
+            )
+
         return data
 
 
@@ -351,13 +365,16 @@ class EmailSerializer(serializers.ModelSerializer):
         return serialized
 
     def get_is_reply(self, obj):
-        return obj.reply_to is not None
+        return obj.reply_to_id is not None
 
     def get_sender_id(self, obj):
-        return obj.sender.id
+        return obj.sender_id
 
     def get_sender_profile_url(self, obj):
-        sender_profile = UserProfile.objects.filter(user=obj.sender).first()
+        try:
+            sender_profile = obj.sender.profile
+        except UserProfile.DoesNotExist:
+            sender_profile = None
         return (
             sender_profile.profile_picture.url
             if sender_profile and sender_profile.profile_picture
@@ -431,11 +448,9 @@ class CreateEmailSerializer(serializers.ModelSerializer):
         sender = self.context["request"].user
 
         # Find or create users for recipients
-        print("doing recipients")
         recipients = []
         for email in recipients_emails:
             user, created = User.objects.get_or_create(email=email)
-            print(user)
             recipients.append(user)
 
         cc = []
@@ -460,9 +475,11 @@ class CreateEmailSerializer(serializers.ModelSerializer):
         if attachments:
             for attachment_data in attachments:
                 try:
-                    print("Processing attachment:", attachment_data)
-                    print("Attachment name:", attachment_data.name)
-                    print("Attachment content type:", attachment_data.content_type)
+                    logger.debug(
+                        "Processing attachment %s (%s)",
+                        attachment_data.name,
+                        attachment_data.content_type,
+                    )
 
                     attachment = Attachment.objects.create(
                         file=attachment_data,
@@ -471,7 +488,7 @@ class CreateEmailSerializer(serializers.ModelSerializer):
                     )
                     attachment_objects.append(attachment)
                 except Exception as e:
-                    print(f"Error creating attachment: {e}")
+                    logger.warning("Error creating attachment: %s", e)
 
         email = Email.objects.create(sender=sender, **validated_data)
         # Set recipients, CC, and BCC
@@ -493,10 +510,8 @@ def notify_recipients(email):
     recipients.update(email.bcc.all())
 
     if not recipients:
-        print("No recipients to notify")
+        logger.debug("No recipients to notify for email %s", email.pk)
         return
-    
-    print(recipients)
 
     email_data = EmailSerializer(email).data
     channel_layer = get_channel_layer()
@@ -520,15 +535,13 @@ def notify_recipients(email):
 
             handle_auto_reply(email, recipient)
         except Exception as e:
-            print(f"Error notifying user {recipient.id}: {e}")
+            logger.warning("Error notifying user %s: %s", recipient.id, e)
 
 
 def handle_auto_reply(email: Email, recipient):
-    print("handling auto reply")
     try:
         if not email.is_auto_replied:
             user_settings = UserSettings.objects.get(user=recipient)
-            print("Found user")
             if user_settings.auto_reply_enabled:
                 auto_reply_message = user_settings.auto_reply_message
                 auto_reply_email = Email.objects.create(
@@ -566,18 +579,13 @@ def handle_auto_reply(email: Email, recipient):
                     "notification": auto_reply_notification_data,
                 }
 
-                print()
-                print()
-
-                print(auto_reply_notification_data)
-
                 group = f"user_{email.sender.id}_emails"
-                print(f"Sending auto-reply to group: {group}")
+                logger.debug("Sending auto-reply to group: %s", group)
                 async_to_sync(get_channel_layer().group_send)(group, auto_reply_message)
     except UserSettings.DoesNotExist:
-        print(f"No user settings found for user {recipient.id}")
+        logger.warning("No user settings found for user %s", recipient.id)
     except Exception as e:
-        print(f"Error handling auto-reply for user {recipient.id}: {e}")
+        logger.warning("Error handling auto-reply for user %s: %s", recipient.id, e)
 
 
 def plain_text_to_quill_delta(text):
@@ -593,7 +601,7 @@ class EmailDetailSerializer(
 
     class Meta:
         model = Email
-        fields = "__all__"  # or list specific fields, including 'replies'
+        exclude = ["search_text"]  # Internal to the search index
 
     def get_replies(self, obj):
         # Serialize replies, possibly with a simplified serializer
@@ -638,11 +646,11 @@ class NotificationSerializer(serializers.ModelSerializer):
 
 
 class PhoneNumberSerializer(serializers.Serializer):
-    phone_number = serializers.CharField(max_length=20)
+    phone_number = serializers.CharField(max_length=20, validators=[phone_regex])
 
 
 class VerificationCodeSerializer(serializers.Serializer):
-    phone_number = serializers.CharField(max_length=20)
+    phone_number = serializers.CharField(max_length=20, validators=[phone_regex])
     code = serializers.CharField(max_length=6)
 
 
@@ -662,4 +670,4 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
 
 class ForgetPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField()
-    phone_number = serializers.CharField(max_length=20)
+    phone_number = serializers.CharField(max_length=20, validators=[phone_regex])
@@ -0,0 +1,202 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .models import Email, Label, User, UserProfile, UserSettings
+from .utils import invalidate_mailboxes, invalidate_session_user
+
+# pre_clear rather than post_clear, while the cleared rows can still be read
+M2M_INVALIDATING_ACTIONS = ("post_add", "post_remove", "pre_clear")
+
+# Fields of other models that EmailSerializer renders into email lists
+MAILBOX_RENDERED_FIELDS = {User: "email", UserProfile: "profile_picture"}
+
+
+def email_participant_ids(emails):
+    """
+    Collect the ids of every user whose mailbox lists any of the given emails.
+    """
+    user_ids = set()
+    for email in emails:
+        user_ids.add(email.sender_id)
+        user_ids.update(email.recipients.values_list("id", flat=True))
+        user_ids.update(email.cc.values_list("id", flat=True))
+        user_ids.update(email.bcc.values_list("id", flat=True))
+    return user_ids
+
+
+def invalidate_mailboxes_on_commit(user_ids):
+    """
+    Retire the users' cached email lists once the current transaction commits.
+
+    Invalidating earlier would let a concurrent list request cache the
+    pre-commit rows under the fresh mailbox version. The ids are resolved
+    now, while pre_* receivers can still read the rows being removed.
+    """
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: invalidate_mailboxes(user_ids))
+
+
+def invalidate_session_user_on_commit(session_token):
+    # Same race as for mailboxes: a request could re-cache the pre-commit user
+    if session_token:
+        transaction.on_commit(lambda: invalidate_session_user(session_token))
+
+
+def correspondent_ids(user_id):
+    """
+    Collect the ids of every user whose mailbox lists an email the user takes part in.
+    """
+    email_ids = Email.objects.filter(
+        Q(sender=user_id) | Q(recipients=user_id) | Q(cc=user_id) | Q(bcc=user_id)
+    ).values("id")
+    user_ids = {user_id}
+    user_ids.update(
+        Email.objects.filter(pk__in=email_ids).values_list("sender_id", flat=True)
+    )
+    for through in (
+        Email.recipients.through,
+        Email.cc.through,
+        Email.bcc.through,
+    ):
+        user_ids.update(
+            through.objects.filter(email_id__in=email_ids).values_list(
+                "user_id", flat=True
+            )
+        )
+    return user_ids
+
+
+def field_changed(instance, field, update_fields):
+    """
+    Tell whether saving the instance writes a new value to the given field.
+    """
+    if update_fields is not None and field not in update_fields:
+        return False
+    if field in instance.get_deferred_fields():
+        return False
+    if instance._state.adding:
+        return True
+    stored = (
+        type(instance)
+        ._default_manager.filter(pk=instance.pk)
+        .values_list(field, flat=True)
+        .first()
+    )
+    return getattr(instance, field) != stored
+
+
+@receiver(post_save, sender=User)
+def create_user_settings(sender, instance, created, raw=False, **kwargs):
+    # dumped_data.json carries a settings row per user; creating one here
+    # would collide with it during loaddata
+    if created and not raw:
+        UserSettings.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_session_user(sender, instance, **kwargs):
+    # The cached copy would otherwise serve stale fields until the token expires
+    invalidate_session_user_on_commit(instance.session_token)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=UserSettings)
+def invalidate_cached_session_user_relations(sender, instance, **kwargs):
+    # Cached session users carry their profile and settings along
+    session_token = (
+        User.objects.filter(pk=instance.user_id)
+        .values_list("session_token", flat=True)
+        .first()
+    )
+    invalidate_session_user_on_commit(session_token)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=UserProfile)
+def note_mailbox_field_changes(sender, instance, update_fields=None, **kwargs):
+    instance._mailbox_fields_changed = field_changed(
+        instance, MAILBOX_RENDERED_FIELDS[sender], update_fields
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def invalidate_email_lists_on_user_change(sender, instance, **kwargs):
+    # Correspondents' cached lists render this user's address and picture
+    if getattr(instance, "_mailbox_fields_changed", False):
+        user_id = instance.pk if sender is User else instance.user_id
+        invalidate_mailboxes_on_commit(correspondent_ids(user_id))
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=UserProfile)
+def invalidate_email_lists_on_user_delete(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_mailboxes_on_commit(correspondent_ids(user_id))
+
+
+@receiver(post_save, sender=Email)
+@receiver(pre_delete, sender=Email)
+def invalidate_email_lists(sender, instance, **kwargs):
+    invalidate_mailboxes_on_commit(email_participant_ids([instance]))
+
+
+@receiver(m2m_changed, sender=Email.recipients.through)
+@receiver(m2m_changed, sender=Email.cc.through)
+@receiver(m2m_changed, sender=Email.bcc.through)
+@receiver(m2m_changed, sender=Email.attachments.through)
+def invalidate_email_lists_on_email_relations(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in M2M_INVALIDATING_ACTIONS:
+        return
+
+    is_attachment = sender is Email.attachments.through
+    if not reverse:
+        user_ids = email_participant_ids([instance])
+        # Users just removed from the email are no longer participants
+        if pk_set and not is_attachment:
+            user_ids.update(pk_set)
+    else:
+        email_ids = pk_set
+        if email_ids is None:
+            email_ids = sender.objects.filter(
+                **{instance._meta.model_name: instance}
+            ).values_list("email_id", flat=True)
+        user_ids = email_participant_ids(Email.objects.filter(pk__in=email_ids))
+        if not is_attachment:
+            user_ids.add(instance.pk)
+    invalidate_mailboxes_on_commit(user_ids)
+
+
+@receiver(m2m_changed, sender=Label.emails.through)
+def invalidate_email_lists_on_labels(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in M2M_INVALIDATING_ACTIONS:
+        return
+
+    if reverse:
+        emails = [instance]
+    elif pk_set is not None:
+        emails = Email.objects.filter(pk__in=pk_set)
+    else:
+        emails = instance.emails.all()
+    invalidate_mailboxes_on_commit(email_participant_ids(emails))
+
+
+@receiver(post_save, sender=Label)
+@receiver(pre_delete, sender=Label)
+def invalidate_email_lists_on_label_change(sender, instance, **kwargs):
+    invalidate_mailboxes_on_commit(email_participant_ids(instance.emails.all()))
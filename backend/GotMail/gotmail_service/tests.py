@@ -1,3 +1,389 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from .middleware import SessionTokenMiddleware
+from .models import Email, User, UserProfile, UserSettings
+from .utils import (
+    EMAIL_SEARCH_TEXT_MAX_LENGTH,
+    mailbox_version_key,
+    session_cache_key,
+)
+from .views import SessionTokenAuthentication
+
+LOCMEM_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SessionUserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number="+84901234567", password="x", email="a@a.com"
+        )
+        UserProfile.objects.create(user=self.user)
+        self.user.generate_session_token()
+        self.token = self.user.session_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.token)
+
+    def authenticate(self):
+        response = self.client.get("/user/darkmode/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(cache.get(session_cache_key(self.token)))
+
+    def test_user_save_invalidates(self):
+        self.authenticate()
+        self.user.first_name = "Z"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+
+    def test_invalidation_waits_for_commit(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            self.assertIsNotNone(cache.get(session_cache_key(self.token)))
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+
+    def test_user_delete_invalidates(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).delete()
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+        self.assertEqual(self.client.get("/user/darkmode/").status_code, 403)
+
+    def test_logout_invalidates(self):
+        self.authenticate()
+        self.client.post("/auth/logout/", {"session_token": self.token})
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+        self.assertEqual(self.client.get("/user/darkmode/").status_code, 403)
+
+    def test_profile_save_and_delete_invalidate(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.save()
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=self.user).delete()
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+
+    def test_deleted_profile_is_not_served_from_cache(self):
+        self.assertEqual(self.client.get("/user/profile/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete("/user/profile/")
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get("/user/profile/").status_code, 404)
+        response = self.client.patch(
+            "/user/profile/", {"bio": "back"}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_settings_save_and_delete_invalidate(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch("/user/darkmode/", {"dark_mode": True}, format="json")
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+        self.assertEqual(
+            self.client.get("/user/darkmode/").json(), {"dark_mode": True}
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSettings.objects.filter(user=self.user).delete()
+        self.assertIsNone(cache.get(session_cache_key(self.token)))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SampleDataTests(TestCase):
+    def test_every_sample_user_has_settings(self):
+        # Loaded the way the README does, after the settings backfill migration
+        call_command(
+            "loaddata",
+            settings.BASE_DIR / "dumped_data.json",
+            exclude=["auth.permission", "contenttypes"],
+            verbosity=0,
+        )
+        self.assertFalse(User.objects.filter(settings__isnull=True).exists())
+
+        user = User.objects.get(phone_number="+123456789")
+        user.generate_session_token()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=user.session_token)
+        for path in ("/user/darkmode/", "/user/email_pref/", "/user/settings/"):
+            self.assertEqual(self.client.get(path).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EmailListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create_user(
+            phone_number="+84901234567", password="x", email="a@a.com"
+        )
+        self.recipient = User.objects.create_user(
+            phone_number="+84901234568", password="x", email="b@b.com"
+        )
+        for user in (self.sender, self.recipient):
+            UserProfile.objects.create(user=user)
+            user.generate_session_token()
+        email = Email.objects.create(sender=self.sender, subject="s", body="b")
+        email.recipients.add(self.recipient)
+
+        self.sender_client = APIClient()
+        self.sender_client.credentials(HTTP_AUTHORIZATION=self.sender.session_token)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.recipient.session_token)
+
+    def inbox(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get("/email_list/?mailbox=inbox", **headers)
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.inbox()["ETag"]
+        self.assertEqual(self.inbox(etag).status_code, 304)
+
+    def test_sender_email_change_invalidates_recipient_list(self):
+        etag = self.inbox()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.sender_client.patch(
+                "/user/profile/", {"email": "a2@a.com"}, format="multipart"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.inbox(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["sender"], "a2@a.com")
+
+    def test_sender_login_keeps_recipient_list(self):
+        etag = self.inbox()["ETag"]
+        self.sender.generate_session_token()
+        self.assertEqual(self.inbox(etag).status_code, 304)
+
+    def test_token_helpers_skip_the_change_check(self):
+        # Only the UPDATE itself; no read-back of the stored email
+        for generate in (
+            self.sender.generate_session_token,
+            self.sender.generate_verification_code,
+            self.sender.generate_password_reset_token,
+        ):
+            with self.assertNumQueries(1):
+                generate()
+
+    def test_sender_profile_picture_change_invalidates_recipient_list(self):
+        etag = self.inbox()["ETag"]
+        profile = self.sender.profile
+        profile.profile_picture = "profile_pictures/new.png"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.inbox(etag).status_code, 200)
+
+    def test_invalidation_waits_for_commit(self):
+        etag = self.inbox()["ETag"]
+        version = cache.get(mailbox_version_key(self.recipient.pk))
+        email = Email.objects.get(sender=self.sender)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            email.is_starred = True
+            email.save()
+            # A list read before commit must not see a fresh version
+            self.assertEqual(cache.get(mailbox_version_key(self.recipient.pk)), version)
+
+        self.assertIsNone(cache.get(mailbox_version_key(self.recipient.pk)))
+        self.assertEqual(self.inbox(etag).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EmailListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number="+84901234567", password="x", email="a@a.com"
+        )
+        self.user.generate_session_token()
+        now = timezone.now()
+        # Two emails share each timestamp to exercise the cursor's tie-break
+        for i in range(7):
+            email = Email.objects.create(
+                sender=self.user,
+                subject=f"s{i}",
+                body="b",
+                sent_at=now - timedelta(minutes=i // 2),
+            )
+            email.recipients.add(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.user.session_token)
+
+    def test_plain_list_without_page_size(self):
+        response = self.client.get("/email_list/", {"mailbox": "inbox"})
+        self.assertEqual(len(response.json()), 7)
+
+    def test_cursor_pages_cover_the_mailbox_once(self):
+        response = self.client.get(
+            "/email_list/", {"mailbox": "inbox", "page_size": 3}
+        )
+        page = response.json()
+        self.assertEqual(sorted(page), ["next", "previous", "results"])
+        self.assertIsNone(page["previous"])
+
+        ids = [email["id"] for email in page["results"]]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            self.assertLessEqual(len(page["results"]), 3)
+            ids += [email["id"] for email in page["results"]]
+        expected = Email.objects.order_by("-sent_at", "-id").values_list(
+            "id", flat=True
+        )
+        self.assertEqual(ids, list(expected))
+
+    def test_unknown_mailbox_is_empty(self):
+        for params in ({}, {"page_size": 5}, {"search": "hi"}):
+            response = self.client.get(
+                "/email_list/", {"mailbox": "bogus", **params}
+            )
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data["results"] if "page_size" in params else data, [])
+
+
+def quill_delta(*inserts):
+    return json.dumps([{"insert": text} for text in inserts])
+
+
+@skipUnless(connection.vendor == "postgresql", "Full-text search needs Postgres")
+@override_settings(CACHES=LOCMEM_CACHE)
+class EmailSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number="+84901234567", password="x", email="a@a.com"
+        )
+        self.user.generate_session_token()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.user.session_token)
+
+    def send(self, subject, body):
+        email = Email.objects.create(sender=self.user, subject=subject, body=body)
+        email.recipients.add(self.user)
+        return email
+
+    def search(self, query):
+        response = self.client.get(
+            "/email_list/", {"mailbox": "inbox", "search": query}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [email["id"] for email in response.json()]
+
+    def test_matches_body_text_ranked(self):
+        once = self.send("hello", quill_delta("quarterly numbers\n"))
+        twice = self.send("quarterly", quill_delta("quarterly numbers\n"))
+        self.send("other", quill_delta("nothing here\n"))
+        self.assertEqual(self.search("quarterly"), [twice.id, once.id])
+
+    def test_ignores_quill_markup(self):
+        self.send("s", quill_delta("plain words\n"))
+        self.assertEqual(self.search("insert"), [])
+        self.assertEqual(self.search("attributes"), [])
+
+    def test_large_body_is_saved_and_searchable(self):
+        body = quill_delta("needle ", "x" * 1_800_000)
+        email = self.send("big", body)
+        self.assertEqual(len(email.search_text), EMAIL_SEARCH_TEXT_MAX_LENGTH)
+        self.assertEqual(self.search("needle"), [email.id])
+
+    def test_body_update_refreshes_search_text(self):
+        email = self.send("s", quill_delta("draft\n"))
+        email.body = quill_delta("revised\n")
+        email.save(update_fields=["body"])
+        self.assertEqual(self.search("revised"), [email.id])
+        self.assertEqual(self.search("draft"), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AutoReplySettingsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number="+84901234567", password="x", email="a@a.com"
+        )
+        self.user.generate_session_token()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.user.session_token)
+
+    def test_inverted_dates_return_field_error(self):
+        response = self.client.put(
+            "/user/auto_rep/",
+            {
+                "auto_reply_enabled": True,
+                "auto_reply_message": "away",
+                "auto_reply_start_date": "2030-01-02T00:00:00Z",
+                "auto_reply_end_date": "2030-01-01T00:00:00Z",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ["auto_reply_end_date"])
+
+    def test_update_checks_stored_start_date(self):
+        UserSettings.objects.filter(user=self.user).update(
+            auto_reply_start_date=timezone.now() + timedelta(days=2)
+        )
+        response = self.client.put(
+            "/user/auto_rep/",
+            {"auto_reply_end_date": timezone.now().isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("auto_reply_end_date", response.json())
+
+    def test_toggle_replaces_stale_end_date(self):
+        UserSettings.objects.filter(user=self.user).update(
+            auto_reply_end_date=timezone.now() - timedelta(days=1)
+        )
+        response = self.client.patch("/user/auto_rep/")
+        self.assertEqual(response.status_code, 200)
+
+        user_settings = UserSettings.objects.get(user=self.user)
+        self.assertTrue(user_settings.auto_reply_enabled)
+        self.assertGreater(
+            user_settings.auto_reply_end_date, user_settings.auto_reply_start_date
+        )
+
+
+class SessionTokenMiddlewareTests(SimpleTestCase):
+    def scope_for(self, headers):
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen.update(scope)
+
+        middleware = SessionTokenMiddleware(app)
+        async_to_sync(middleware)({"type": "http", "headers": headers}, None, None)
+        return seen
+
+    def test_flags_authorization_header(self):
+        self.assertIs(self.scope_for([(b"authorization", b"t")])["_has_auth"], True)
+        self.assertIs(self.scope_for([(b"authorization", b"")])["_has_auth"], False)
+        self.assertIs(self.scope_for([(b"accept", b"*/*")])["_has_auth"], False)
+
+    def test_authenticate_skips_flagged_anonymous_requests(self):
+        django_request = RequestFactory().get("/", HTTP_AUTHORIZATION="t")
+        # A False flag wins over the header, so no lookup is attempted
+        django_request.scope = {"_has_auth": False}
+        request = Request(django_request)
+        self.assertIsNone(SessionTokenAuthentication().authenticate(request))
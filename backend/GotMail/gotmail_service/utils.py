@@ -0,0 +1,78 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.utils import timezone
+
+EMAIL_LIST_CACHE_TIMEOUT = 5 * 60
+
+# Keeps the indexed tsvector well under Postgres' 1 MB limit
+EMAIL_SEARCH_TEXT_MAX_LENGTH = 100_000
+
+
+def session_cache_key(session_token):
+    return f"sess:{session_token}"
+
+
+def cache_session_user(user):
+    """
+    Cache an authenticated user under their session token until it expires.
+    """
+    timeout = int((user.session_expiry - timezone.now()).total_seconds())
+    if timeout > 0:
+        cache.set(session_cache_key(user.session_token), user, timeout=timeout)
+
+
+def invalidate_session_user(session_token):
+    """
+    Drop the cached user for a session token, if any.
+    """
+    if session_token:
+        cache.delete(session_cache_key(session_token))
+
+
+def mailbox_version_key(user_id):
+    return f"mbv:{user_id}"
+
+
+def email_list_cache_key(user_id, variant):
+    """
+    Build the cache key for one email list response of a user.
+
+    The key embeds the user's current mailbox version, so invalidating the
+    version retires every cached list of that user at once.
+    """
+    version = cache.get_or_set(
+        mailbox_version_key(user_id), uuid.uuid4().hex, timeout=None
+    )
+    digest = hashlib.md5(variant.encode()).hexdigest()
+    return f"emails:{user_id}:{version}:{digest}"
+
+
+def invalidate_mailboxes(user_ids):
+    cache.delete_many([mailbox_version_key(user_id) for user_id in user_ids])
+
+
+def email_search_text(body):
+    """
+    Extract the plain text of a Quill delta email body for full-text search.
+
+    Bodies that are not a delta are indexed as they are. The result is capped
+    at EMAIL_SEARCH_TEXT_MAX_LENGTH characters.
+    """
+    try:
+        ops = json.loads(body)
+    except (TypeError, ValueError):
+        ops = None
+
+    if isinstance(ops, list):
+        text = "".join(
+            op["insert"]
+            for op in ops
+            if isinstance(op, dict) and isinstance(op.get("insert"), str)
+        )
+    else:
+        text = body or ""
+    return text[:EMAIL_SEARCH_TEXT_MAX_LENGTH]
+
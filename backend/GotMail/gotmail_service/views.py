@@ -1,8 +1,14 @@
+import logging
 from typing import Any, Dict
+from urllib.parse import urlencode
 
 from django.contrib.auth import login, logout
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
 from django.core.mail import EmailMessage
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from django.http import Http404, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import generics, permissions, serializers, status, viewsets
@@ -15,21 +21,22 @@ from rest_framework.generics import (
     RetrieveAPIView,
     RetrieveUpdateDestroyAPIView,
 )
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import (
+    EMAIL_SEARCH_VECTOR,
     Email,
     Label,
     Notification,
     User,
     UserProfile,
-    UserSettings,
 )
 from .phone_verify import send_verification_code, verify_code
 from .serializers import (
+    AUTO_REPLY_DATE_ORDER_ERROR,
     AutoReplySettingsSerializer,
     CreateEmailSerializer,
     EmailSerializer,
@@ -48,6 +55,19 @@ from .serializers import (
     UserSerializer,
     VerificationCodeSerializer,
 )
+from .utils import (
+    EMAIL_LIST_CACHE_TIMEOUT,
+    cache_session_user,
+    email_list_cache_key,
+    invalidate_session_user,
+    session_cache_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Fields UserProfileView.update accepts for the user and their profile
+_USER_FIELDS = ("first_name", "last_name", "email")
+_PROFILE_FIELDS = ("bio", "birthdate")
 
 
 class SessionTokenAuthentication(BaseAuthentication):
@@ -56,17 +76,29 @@ class SessionTokenAuthentication(BaseAuthentication):
     """
 
     def authenticate(self, request):
+        # SessionTokenMiddleware has already looked for the header over ASGI
+        scope = getattr(request._request, "scope", {})
+        if scope.get("_has_auth") is False:
+            return None
+
         session_token = request.headers.get("Authorization")
         if not session_token:
             return None
 
-        try:
-            user = User.objects.get(
-                session_token=session_token, session_expiry__gt=timezone.now()
-            )
-            return (user, None)
-        except User.DoesNotExist:
+        user = self.get_user(session_token)
+        if user is None:
             raise AuthenticationFailed("Invalid or expired token")
+        return (user, None)
+
+    def get_user(self, session_token):
+        user = cache.get(session_cache_key(session_token))
+        if user is not None:
+            return user
+
+        user = User.objects.for_session_token(session_token).first()
+        if user is not None:
+            cache_session_user(user)
+        return user
 
 
 class BaseUserSettingsView(APIView):
@@ -77,15 +109,17 @@ class BaseUserSettingsView(APIView):
     authentication_classes = [SessionTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_or_create_user_settings(self):
+    def get_user_settings(self):
         """
-        Get or create UserSettings for the authenticated user.
+        Get UserSettings for the authenticated user.
+
+        Every user gets a UserSettings row when created, see signals.py, and
+        SessionTokenAuthentication loads it together with the user.
 
         Returns:
             UserSettings: User settings object
         """
-        return UserSettings.objects.get_or_create(user=self.request.user)[0]
-
+        return self.request.user.settings
 
     def handle_settings_update(
         self,
@@ -104,22 +138,21 @@ class BaseUserSettingsView(APIView):
         Returns:
             Response with updated settings or error
         """
-        try:
-            user_settings = self.get_or_create_user_settings()
-            if user_settings:
-                serializer = serializer_class(user_settings, data=data, partial=partial)
-
-                if serializer.is_valid():
-                    serializer.save()
-                    return Response(serializer.data)
+        user_settings = self.get_user_settings()
+        serializer = serializer_class(user_settings, data=data, partial=partial)
 
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if serializer.is_valid():
+            try:
+                serializer.save()
+            except IntegrityError:
+                # The only constraint these serializers can hit is ar_date_order
+                return Response(
+                    {"auto_reply_end_date": [AUTO_REPLY_DATE_ORDER_ERROR]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return Response(serializer.data)
 
-        except Exception as e:
-            return Response(
-                {"error": "Unable to update settings", "details": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class UserRegistrationService:
@@ -136,15 +169,15 @@ class UserRegistrationService:
             user: Newly created user object
         """
         UserProfile.objects.create(user=user)
-        UserSettings.objects.create(user=user)
 
         default_labels = [
             {"name": "Important", "color": "#FF0000"},
             {"name": "Personal", "color": "#00FF00"},
             {"name": "Work", "color": "#0000FF"},
         ]
-        for label_data in default_labels:
-            Label.objects.create(user=user, **label_data)
+        Label.objects.bulk_create(
+            [Label(user=user, **label_data) for label_data in default_labels]
+        )
 
 
 class RegisterView(APIView):
@@ -162,8 +195,15 @@ class RegisterView(APIView):
 
         try:
             if serializer.is_valid(raise_exception=True):
-                user = serializer.save()
-                UserRegistrationService.create_user_resources(user)
+                try:
+                    with transaction.atomic():
+                        user = serializer.save()
+                        UserRegistrationService.create_user_resources(user)
+                except IntegrityError:
+                    return Response(
+                        {"phone_number": ["Phone number is already registered."]},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
                 login(request, user)
                 return Response(
                     UserSerializer(user).data, status=status.HTTP_201_CREATED
@@ -211,7 +251,7 @@ class LoginView(APIView):
                                 status=status.HTTP_206_PARTIAL_CONTENT,
                             )
                         except Exception as email_error:
-                            print(f"2FA email sending failed: {email_error}")
+                            logger.warning("2FA email sending failed: %s", email_error)
                             return Response(
                                 {"detail": f"Failed to send verification code, {email_error}"},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -231,9 +271,8 @@ class LoginView(APIView):
                     status=status.HTTP_200_OK,
                 )
 
-        except serializer.ValidationError as e:
-            # More detailed error handling
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -253,15 +292,10 @@ class LogoutView(APIView):
             "Authorization"
         )
         if session_token:
-            try:
-                user = User.objects.get(
-                    session_token=session_token, session_expiry__gt=timezone.now()
-                )
-                user.session_token = None
-                user.session_expiry = None
-                user.save()
-            except User.DoesNotExist:
-                pass
+            User.objects.filter(
+                session_token=session_token, session_expiry__gt=timezone.now()
+            ).update(session_token=None, session_expiry=None)
+            invalidate_session_user(session_token)
 
         logout(request)
         return Response(
@@ -281,20 +315,18 @@ class ValidateTokenView(APIView):
         Validate session token.
         """
         session_token = request.data.get("session_token")
-        try:
-            user = User.objects.get(
-                session_token=session_token, session_expiry__gt=timezone.now()
-            )
-            return Response(
-                {"user": UserSerializer(user).data, "message": "Token is valid"},
-                status=status.HTTP_200_OK,
-            )
-        except User.DoesNotExist:
+        user = User.objects.for_session_token(session_token).first()
+        if user is None:
             return Response(
                 {"message": "Invalid or expired token"},
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
+        return Response(
+            {"user": UserSerializer(user).data, "message": "Token is valid"},
+            status=status.HTTP_200_OK,
+        )
+
 
 class UserProfileView(RetrieveUpdateDestroyAPIView):
     """
@@ -311,7 +343,10 @@ class UserProfileView(RetrieveUpdateDestroyAPIView):
         """
         Override get_object to return the profile of the authenticated user.
         """
-        return get_object_or_404(UserProfile, user=self.request.user)
+        try:
+            return self.request.user.profile
+        except UserProfile.DoesNotExist:
+            raise Http404
 
     def update(self, request, *args, **kwargs):
         """
@@ -321,41 +356,35 @@ class UserProfileView(RetrieveUpdateDestroyAPIView):
         instance = self.get_object()
 
         user_data = {
-            "first_name": request.data.get("first_name"),
-            "last_name": request.data.get("last_name"),
-            "email": request.data.get("email"),
+            k: v for k in _USER_FIELDS if (v := request.data.get(k)) is not None
         }
-        if request.user.email != request.data.get("email"):
-            if User.objects.filter(email=request.data.get("email")).exists():
+        email = user_data.get("email")
+        if email is not None and email != request.user.email:
+            if User.objects.filter(email=email).exists():
                 return Response(
                     {"error": "Email is already registered."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-        user_data = {k: v for k, v in user_data.items() if v is not None}
-
         if user_data:
             user_serializer = UserSerializer(request.user, data=user_data, partial=True)
             user_serializer.is_valid(raise_exception=True)
             user_serializer.save()
+        else:
+            user_serializer = UserSerializer(request.user)
 
         profile_data = {
-            "bio": request.data.get("bio"),
-            "birthdate": request.data.get("birthdate"),
+            k: v for k in _PROFILE_FIELDS if (v := request.data.get(k)) is not None
         }
 
         if "profile_picture" in request.FILES:
             profile_data["profile_picture"] = request.FILES["profile_picture"]
 
-        profile_data = {k: v for k, v in profile_data.items() if v is not None}
-
         serializer = self.get_serializer(instance, data=profile_data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
 
-        return Response(
-            {"user": UserSerializer(request.user).data, "profile": serializer.data}
-        )
+        return Response({"user": user_serializer.data, "profile": serializer.data})
 
 
 class AutoReplySettingsView(BaseUserSettingsView):
@@ -367,7 +396,7 @@ class AutoReplySettingsView(BaseUserSettingsView):
         """
         Retrieve current auto-reply settings.
         """
-        user_settings = self.get_or_create_user_settings()
+        user_settings = self.get_user_settings()
         serializer = AutoReplySettingsSerializer(user_settings)
         return Response(serializer.data)
 
@@ -381,28 +410,21 @@ class AutoReplySettingsView(BaseUserSettingsView):
         """
         Toggle auto-reply on/off.
         """
-        try:
-            user_settings = self.get_or_create_user_settings()
-            user_settings.auto_reply_enabled = not user_settings.auto_reply_enabled
-
-            if user_settings.auto_reply_enabled:
-                user_settings.auto_reply_start_date = (
-                    user_settings.auto_reply_start_date or timezone.now()
-                )
-                user_settings.auto_reply_end_date = (
-                    user_settings.auto_reply_end_date
-                    or timezone.now() + timezone.timedelta(days=30)
-                )
-
-            user_settings.save()
-            serializer = AutoReplySettingsSerializer(user_settings)
-            return Response(serializer.data)
+        user_settings = self.get_user_settings()
+        user_settings.auto_reply_enabled = not user_settings.auto_reply_enabled
+
+        if user_settings.auto_reply_enabled:
+            start_date = user_settings.auto_reply_start_date or timezone.now()
+            end_date = user_settings.auto_reply_end_date
+            # A stale end date would otherwise precede the new start
+            if end_date is None or end_date < start_date:
+                end_date = start_date + timezone.timedelta(days=30)
+            user_settings.auto_reply_start_date = start_date
+            user_settings.auto_reply_end_date = end_date
 
-        except Exception as e:
-            return Response(
-                {"error": "Unable to toggle auto-reply", "details": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        user_settings.save()
+        serializer = AutoReplySettingsSerializer(user_settings)
+        return Response(serializer.data)
 
 
 class FontSettingsView(BaseUserSettingsView):
@@ -414,7 +436,7 @@ class FontSettingsView(BaseUserSettingsView):
         """
         Retrieve current font settings.
         """
-        user_settings = self.get_or_create_user_settings()
+        user_settings = self.get_user_settings()
         serializer = FontSettingsSerializer(user_settings)
         return Response(serializer.data)
 
@@ -434,7 +456,7 @@ class DarkModeToggleView(BaseUserSettingsView):
         """
         Retrieve current dark mode setting.
         """
-        user_settings = self.get_or_create_user_settings()
+        user_settings = self.get_user_settings()
         return Response({"dark_mode": user_settings.dark_mode})
 
     def patch(self, request):
@@ -449,13 +471,32 @@ class DarkModeToggleView(BaseUserSettingsView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user_settings = self.get_or_create_user_settings()
+        user_settings = self.get_user_settings()
         user_settings.dark_mode = dark_mode
         user_settings.save()
 
         return Response({"dark_mode": user_settings.dark_mode})
 
 
+class SettingsBundleView(BaseUserSettingsView):
+    """
+    View for fetching all user settings in a single request.
+    """
+
+    def get(self, request):
+        """
+        Retrieve auto-reply, font and dark mode settings together.
+        """
+        user_settings = self.get_user_settings()
+        return Response(
+            {
+                "auto_reply": AutoReplySettingsSerializer(user_settings).data,
+                "font": FontSettingsSerializer(user_settings).data,
+                "dark_mode": user_settings.dark_mode,
+            }
+        )
+
+
 class SendEmailView(CreateAPIView):
     serializer_class = CreateEmailSerializer
     authentication_classes = [SessionTokenAuthentication]
@@ -472,6 +513,18 @@ class SendEmailView(CreateAPIView):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
+class EmailCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (sent_at, id), enabled by passing ``page_size``.
+    Without it the full list is returned, as the mobile client expects.
+    """
+
+    ordering = ("-sent_at", "-id")
+    page_size = None
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
 class EmailListView(ListAPIView):
     """
     API endpoint for listing emails in different mailboxes.
@@ -480,6 +533,7 @@ class EmailListView(ListAPIView):
     serializer_class = EmailSerializer
     authentication_classes = [SessionTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EmailCursorPagination
 
     def get_queryset(self):
         """
@@ -487,23 +541,35 @@ class EmailListView(ListAPIView):
         """
         user = self.request.user
         mailbox = self.request.query_params.get("mailbox", "inbox")
+        emails = Email.objects.select_related("sender__profile").prefetch_related(
+            "recipients",
+            "cc",
+            "bcc",
+            "attachments",
+            Prefetch(
+                "labels",
+                queryset=Label.objects.prefetch_related(
+                    Prefetch("emails", queryset=Email.objects.only("id"))
+                ),
+            ),
+        )
 
         if mailbox == "inbox":
             return (
-                Email.objects.filter(Q(recipients=user) | Q(cc=user) | Q(bcc=user))
+                emails.filter(Q(recipients=user) | Q(cc=user) | Q(bcc=user))
                 .exclude(is_trashed=True)
                 .order_by("-sent_at")
             )
 
         elif mailbox == "sent":
             return (
-                Email.objects.filter(sender=user)
+                emails.filter(sender=user)
                 .exclude(is_trashed=True)
                 .order_by("-sent_at")
             )
         elif mailbox == "starred":
             return (
-                Email.objects.filter(
+                emails.filter(
                     (Q(recipients=user) | Q(cc=user) | Q(bcc=user)) & Q(is_starred=True)
                 )
                 .exclude(is_trashed=True)
@@ -511,19 +577,63 @@ class EmailListView(ListAPIView):
             )
 
         elif mailbox == "all":
-            return Email.objects.filter(
+            return emails.filter(
                 Q(recipients=user) | Q(cc=user) | Q(bcc=user)
             ).order_by("-sent_at")
 
         elif mailbox == "draft":
-            return Email.objects.filter(sender=user, is_draft=True).order_by("-sent_at")
+            return emails.filter(sender=user, is_draft=True).order_by("-sent_at")
 
         elif mailbox == "trash":
-            return Email.objects.filter(
+            return emails.filter(
                 Q(sender=user) | Q(recipients=user) | Q(cc=user) | Q(bcc=user),
                 is_trashed=True,
             ).order_by("-sent_at")
 
+        # Unknown mailboxes list nothing, and still paginate and search
+        return emails.none()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serve email lists from cache and honor conditional GETs via ETag.
+        """
+        # Attachment URLs are absolute, so the host is part of the variant
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        variant = f"{request.get_host()}?{params}"
+        cache_key = email_list_cache_key(request.user.id, variant)
+        etag = f'"{cache_key}"'
+
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponseNotModified()
+        else:
+            data = cache.get(cache_key)
+            if data is None:
+                data = super().list(request, *args, **kwargs).data
+                cache.set(cache_key, data, EMAIL_LIST_CACHE_TIMEOUT)
+            response = Response(data)
+
+        response["ETag"] = etag
+        return response
+
+    def filter_queryset(self, queryset):
+        """
+        Narrow the mailbox with an optional full-text ``search`` query.
+        Paginated results keep the cursor's date order instead of rank.
+        """
+        search = self.request.query_params.get("search")
+        if not search:
+            return queryset
+
+        query = SearchQuery(search, config="english", search_type="websearch")
+        return (
+            queryset.annotate(
+                search=EMAIL_SEARCH_VECTOR,
+                rank=SearchRank(EMAIL_SEARCH_VECTOR, query),
+            )
+            .filter(search=query)
+            .order_by("-rank", "-sent_at")
+        )
+
 
 class EmailActionView(APIView):
     """
@@ -709,8 +819,6 @@ class OtherUserProfileView(RetrieveAPIView):
     def get_object(self):
         user_id = self.kwargs.get("user_id")
         user = get_object_or_404(User, id=user_id)
-        print("Got user")
-        print(user)
         return get_object_or_404(UserProfile, user=user)
 
     def retrieve(self, request, *args, **kwargs):
@@ -820,7 +928,6 @@ class PasswordResetView(APIView):
                     request, user, email, user.password_reset_token
                 )
                 email.send()
-                print(email)
                 return Response(
                     {"detail": "Password reset code sent."}, status=status.HTTP_200_OK
                 )
@@ -843,15 +950,11 @@ class PasswordResetConfirmView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        print(request.data)
         serializer = PasswordResetConfirmSerializer(data=request.data)
         if serializer.is_valid():
             email = serializer.validated_data["email"]
             code = serializer.validated_data["code"]
             new_password = serializer.validated_data["new_password"]
-            print("confirming reset password")
-            print(code)
-            print(new_password)
             try:
                 user = User.objects.get(email=email)
                 if (
@@ -914,8 +1017,7 @@ class Enable2FAView(APIView):
     def post(self, request):
         serializer = Enable2FASerializer(data=request.data)
         if serializer.is_valid():
-            user = request.user
-            user_profile = UserProfile.objects.get(user=user)
+            user_profile = request.user.profile
             user_profile.two_factor_enabled = True
             user_profile.save()
             return Response(